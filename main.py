@@ -1,13 +1,24 @@
 #!/usr/bin/env python3
+import atexit
 import fitz  # PyMuPDF
-import hashlib
 import os
 import re
+import string
+import xxhash
 import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from pathlib import Path
 from tkinter import Tk, filedialog
 from tkinter.messagebox import showinfo
 
+HASH_PREFIX_BYTES = 256 * 1024  # Image bytes hashed for duplicate detection
+MERGE_READ_AHEAD = 4  # Input files read ahead of the merge loop
+PAGE_SPEC_PART = re.compile(r'(\d+)\s*(?:-\s*(\d+))?')  # 'N' or 'N-M' in a page spec
+
+_tk_root = None  # Hidden Tk root shared by all dialogs, created on first use
+
 def display_manual():
     """Show user-friendly manual in terminal."""
     print("""
@@ -31,141 +42,217 @@ Functions:
 
 """)
 
+def get_tk_root():
+    """Create the hidden Tk root once; it is destroyed at program exit."""
+    global _tk_root
+    if _tk_root is None:
+        _tk_root = Tk()
+        _tk_root.withdraw()
+        atexit.register(_tk_root.destroy)
+    return _tk_root
+
 def get_pdf_path(multiple=False):
-    """Get PDF path(s) with proper Tkinter cleanup."""
-    root = Tk()
-    root.withdraw()
+    """Get PDF path(s) using the shared hidden Tk root."""
+    root = get_tk_root()
     if multiple:
         paths = filedialog.askopenfilenames(
+            parent=root,
             title="Select PDF files",
             filetypes=[("PDF files", "*.pdf"), ("All files", "*.*")]
         )
-        root.destroy()
         return paths if paths else None
     else:
         path = filedialog.askopenfilename(
+            parent=root,
             title="Select PDF file",
             filetypes=[("PDF files", "*.pdf"), ("All files", "*.*")]
         )
-        root.destroy()
         return path if path else None
 
+def iter_page_spec(page_spec, separator=','):
+    """Yield (start, end) for each 'N' or 'N-M' token in a page spec.
+
+    Raises ValueError if anything but separators and whitespace lies between tokens.
+    """
+    gap_chars = separator + string.whitespace
+    pos = 0
+    for match in PAGE_SPEC_PART.finditer(page_spec):
+        if page_spec[pos:match.start()].strip(gap_chars):
+            raise ValueError(f"Invalid page spec: '{page_spec}'")
+        pos = match.end()
+        start = int(match.group(1))
+        yield start, int(match.group(2) or start)
+    if page_spec[pos:].strip(gap_chars):
+        raise ValueError(f"Invalid page spec: '{page_spec}'")
+
+def merge_ranges(ranges):
+    """Sort (start, end) ranges and merge overlapping or adjacent ones."""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def parse_page_runs(page_spec, total_pages, separator=','):
+    """Convert a page spec into sorted (start, end) runs clipped to the document."""
+    ranges = []
+    for start, end in iter_page_spec(page_spec, separator):
+        # Clip before anything is expanded so huge specs stay cheap
+        start, end = max(start, 1), min(end, total_pages)
+        if start <= end:
+            ranges.append((start, end))
+    return merge_ranges(ranges)
+
 def parse_page_range(page_str, total_pages):
     """Convert input like '1,3-5' into sorted list of page numbers (1-based)."""
-    pages = set()
-    for part in re.split(r'[,\s]+', page_str.strip()):
-        if not part:
-            continue
-        if '-' in part:
-            start, end = map(int, part.split('-'))
-            pages.update(range(start, end + 1))
-        else:
-            pages.add(int(part))
-    return sorted(p for p in pages if 1 <= p <= total_pages)
+    return [p for start, end in parse_page_runs(page_str, total_pages)
+            for p in range(start, end + 1)]
 
 def parse_special_split(page_spec, total_pages):
-    """Parse special split input like '1+4+11-16' into page numbers."""
-    pages = set()
-    for part in re.split(r'\+', page_spec.strip()):
-        if not part:
-            continue
-        if '-' in part:
-            start, end = map(int, part.split('-'))
-            pages.update(range(start, end + 1))
-        else:
-            pages.add(int(part))
-    return sorted(p for p in pages if 1 <= p <= total_pages)
+    """Parse special split input like '1+4+11-16' into sorted (start, end) page runs."""
+    return parse_page_runs(page_spec, total_pages, separator='+')
 
-def remove_pages(input_pdf, output_pdf, page_range):
-    """Remove specified pages from PDF."""
-    doc = fitz.open(input_pdf)
-    total_pages = len(doc)
-    
+def remove_pages(doc, output_pdf, page_range):
+    """Remove specified pages from an open PDF and save the result."""
     if not page_range:
         print("No pages to remove!")
-        doc.close()
         return False
 
-    # Convert to 0-based and remove duplicates
-    pages_to_remove = sorted({p-1 for p in page_range}, reverse=True)
+    # Coalesce into contiguous runs; delete from the back so numbers stay valid
+    for start, end in reversed(merge_ranges((p, p) for p in page_range)):
+        doc.delete_pages(from_page=start-1, to_page=end-1)
     
-    for page_num in pages_to_remove:
-        doc.delete_page(page_num)
-    
-    doc.save(output_pdf)
-    doc.close()
+    if os.path.abspath(output_pdf) == os.path.abspath(doc.name):
+        if doc.can_save_incrementally():
+            # Saving over the source: append only the changed objects
+            doc.save(output_pdf, incremental=True, encryption=fitz.PDF_ENCRYPT_KEEP)
+        else:
+            # Repaired files can't be saved incrementally, and a full save
+            # over the open source is refused: rebuild in memory, then write
+            data = doc.tobytes(garbage=3, deflate=True)
+            with open(output_pdf, 'wb') as f:
+                f.write(data)
+    else:
+        doc.save(output_pdf, garbage=3, deflate=True)
     return True
 
-def get_image_hash(img_data):
-    """Generate MD5 hash for image data."""
-    return hashlib.md5(img_data).hexdigest()
+def get_image_hash(img_data, full=False):
+    """Hash the first HASH_PREFIX_BYTES of image data plus its length (or all of it)."""
+    if full:
+        return xxhash.xxh3_128(img_data).hexdigest()
+    prefix = memoryview(img_data)[:HASH_PREFIX_BYTES]
+    return f"{xxhash.xxh3_64(prefix).hexdigest()}_{len(img_data)}"
 
 def remove_duplicates(input_pdf, output_pdf, export_zip, repeat_threshold, min_size_kb):
     """Remove duplicate images from PDF."""
-    doc = fitz.open(input_pdf)
-    image_counts = {}
+    doc = fitz.open(input_pdf, filetype="pdf")
+    image_counts = {}  # hash -> [count, first image data, ext, xrefs in order]
     removed_hashes = set()
     removed_images = []
+    pending_deletes = {}  # page number -> duplicate xrefs to delete there
     min_size_bytes = min_size_kb * 1024
+    duplicates_removed = 0
 
-    # First pass: Count image occurrences
-    for page in doc:
-        for img in page.get_images():
-            xref = img[0]
-            base_image = doc.extract_image(xref)
-            img_data = base_image["image"]
-            img_ext = base_image["ext"]
-            img_size = len(img_data)
-            img_hash = get_image_hash(img_data)
-
-            if img_hash in image_counts:
-                image_counts[img_hash][0] += 1
-                image_counts[img_hash][1].append((xref, img_data, img_ext, img_size))
-            else:
-                image_counts[img_hash] = [1, [(xref, img_data, img_ext, img_size)]]
+    # Group occurrences by xref without decoding anything: every use of an
+    # xref is the same image object, so it is only decoded and hashed once
+    xref_pages = {}  # xref -> page numbers using it, in document order
+    for pno in range(len(doc)):
+        for img in doc.get_page_images(pno):
+            xref_pages.setdefault(img[0], []).append(pno)
+    total_images = sum(len(pages) for pages in xref_pages.values())
+
+    # Hash distinct xrefs only, to find separate objects holding the same bytes
+    for xref, pages in xref_pages.items():
+        # Quick pre-filter on the stored (compressed) /Length, read without
+        # decoding. The size threshold itself applies to the extracted data
+        # below, which may be re-encoded (e.g. to PNG) and differ in size;
+        # this only skips streams that are stored smaller than the threshold
+        length_type, length = doc.xref_get_key(xref, "Length")
+        if length_type == "int" and int(length) < min_size_bytes:
+            continue
+        base_image = doc.extract_image(xref)
+        img_data = base_image["image"]
+        img_hash = get_image_hash(img_data)
+        # A prefix match is only a candidate: confirm it byte-for-byte
+        if img_hash in image_counts and image_counts[img_hash][1] != img_data:
+            img_hash = get_image_hash(img_data, full=True)
+
+        if img_hash in image_counts:
+            image_counts[img_hash][0] += len(pages)
+            image_counts[img_hash][3].append(xref)
+        else:
+            image_counts[img_hash] = [len(pages), img_data, base_image["ext"], [xref]]
 
-    # Second pass: Remove duplicates
-    duplicates_removed = 0
-    for img_hash, (count, xrefs) in image_counts.items():
-        if count >= repeat_threshold and len(xrefs[0][1]) >= min_size_bytes:
-            for xref, img_data, img_ext, img_size in xrefs[1:]:  # Keep first occurrence
-                for page in doc:
-                    try:
-                        page.delete_image(xref)
-                        duplicates_removed += 1
-                        if img_hash not in removed_hashes:
-                            removed_images.append((img_data, img_ext, img_hash))
-                            removed_hashes.add(img_hash)
-                        break
-                    except:
-                        continue
-
-    # Save outputs
-    doc.save(output_pdf)
+    # Every occurrence after the first is a duplicate. delete_image replaces
+    # the whole xref object, so each xref that has such an occurrence is
+    # deleted once, on one of its pages
+    for img_hash, (count, img_data, img_ext, xrefs) in image_counts.items():
+        if count < repeat_threshold or len(img_data) < min_size_bytes:
+            continue
+        first_xref = xrefs[0]
+        dup_xrefs = xrefs[1:] if len(xref_pages[first_xref]) == 1 else xrefs
+        if not dup_xrefs:
+            continue
+        for xref in dup_xrefs:
+            pending_deletes.setdefault(xref_pages[xref][0], []).append(xref)
+        duplicates_removed += count - 1
+        removed_images.append((img_data, img_ext, img_hash))
+        removed_hashes.add(img_hash)
+
+    # Load each affected page once and consolidate its contents a single time
+    for page_num, xrefs in pending_deletes.items():
+        page = doc[page_num]
+        for xref in xrefs:
+            page.delete_image(xref)
+        page.clean_contents()
+
+    # Save outputs; garbage collection drops the orphaned image streams
+    doc.save(output_pdf, garbage=3, deflate=True)
     doc.close()
 
     if duplicates_removed > 0:
-        with zipfile.ZipFile(export_zip, 'w') as zipf:
+        # Images are already compressed: store them as-is
+        with zipfile.ZipFile(export_zip, 'w', compression=zipfile.ZIP_STORED) as zipf:
             for img_data, ext, img_hash in removed_images:
                 zipf.writestr(f"duplicate_{img_hash[:8]}.{ext}", img_data)
 
-    return (sum(count for count, _ in image_counts.values()), 
-            duplicates_removed, 
+    return (total_images,
+            duplicates_removed,
             len(removed_hashes))
 
+def read_file_bytes(path):
+    """Read whole file into memory."""
+    with open(path, 'rb') as f:
+        return f.read()
+
 def merge_pdfs(pdf_paths, output_path):
     """Merge multiple PDFs into one, sorted by filename."""
     merged_doc = fitz.open()
-    
-    for pdf_path in sorted(pdf_paths):
-        try:
-            doc = fitz.open(pdf_path)
-            merged_doc.insert_pdf(doc)
-            doc.close()
-            print(f"Added: {os.path.basename(pdf_path)}")
-        except Exception as e:
-            print(f"Error merging {pdf_path}: {e}")
-            continue
+    pdf_paths = sorted(pdf_paths)
+
+    # Reads overlap on a thread pool; MuPDF is not thread-safe, so parsing
+    # and inserting stay serial and in filename order. Only MERGE_READ_AHEAD
+    # files are held in memory at once
+    with ThreadPoolExecutor(max_workers=MERGE_READ_AHEAD) as pool:
+        pending = deque((p, pool.submit(read_file_bytes, p))
+                        for p in pdf_paths[:MERGE_READ_AHEAD])
+        next_paths = iter(pdf_paths[MERGE_READ_AHEAD:])
+        while pending:
+            pdf_path, data = pending.popleft()
+            next_path = next(next_paths, None)
+            if next_path is not None:
+                pending.append((next_path, pool.submit(read_file_bytes, next_path)))
+            try:
+                doc = fitz.open(stream=data.result(), filetype="pdf")
+                merged_doc.insert_pdf(doc)
+                doc.close()
+                print(f"Added: {os.path.basename(pdf_path)}")
+            except Exception as e:
+                print(f"Error merging {pdf_path}: {e}")
+            # Release this file's bytes before the next one is waited on
+            doc = data = None
     
     if len(merged_doc) > 0:
         merged_doc.save(output_path)
@@ -175,45 +262,42 @@ def merge_pdfs(pdf_paths, output_path):
         merged_doc.close()
         return False
 
-def split_pdf(input_pdf, page_ranges):
-    """Split PDF into multiple files based on page ranges."""
-    input_name = os.path.splitext(os.path.basename(input_pdf))[0]
-    input_dir = os.path.dirname(input_pdf)
-    doc = fitz.open(input_pdf)
+def split_pdf(doc, page_ranges):
+    """Split an open PDF into multiple files based on page ranges."""
+    input_path = Path(doc.name)
     
     created_files = []
     for i, (start, end) in enumerate(page_ranges, 1):
-        output_pdf = os.path.join(input_dir, f"{input_name}_pages_{start}-{end}.pdf")
+        output_name = f"{input_path.stem}_pages_{start}-{end}.pdf"
+        output_pdf = str(input_path.with_name(output_name))
         new_doc = fitz.open()
         new_doc.insert_pdf(doc, from_page=start-1, to_page=end-1)
         new_doc.save(output_pdf)
         new_doc.close()
         created_files.append(output_pdf)
-        print(f"Created: {os.path.basename(output_pdf)}")
+        print(f"Created: {output_name}")
     
-    doc.close()
     return created_files
 
-def special_split_pdf(input_pdf, page_spec):
-    """Create new PDF with specified pages/ranges."""
-    doc = fitz.open(input_pdf)
-    total_pages = len(doc)
-    new_doc = fitz.open()
-    
-    pages_to_extract = parse_special_split(page_spec, total_pages)
-    if not pages_to_extract:
+def special_split_pdf(doc, page_spec):
+    """Create new PDF with specified pages/ranges of an open PDF."""
+    page_runs = parse_special_split(page_spec, len(doc))
+    if not page_runs:
         print("No valid pages specified!")
         return None
     
-    for page_num in pages_to_extract:
-        new_doc.insert_pdf(doc, from_page=page_num-1, to_page=page_num-1)
+    new_doc = fitz.open()
+    # One insert per contiguous run; keep the graft map between calls
+    # (final=False) so shared resources are copied once
+    last = len(page_runs) - 1
+    for i, (start, end) in enumerate(page_runs):
+        new_doc.insert_pdf(doc, from_page=start-1, to_page=end-1,
+                           final=(i == last))
     
-    input_name = os.path.splitext(os.path.basename(input_pdf))[0]
-    output_pdf = os.path.join(os.path.dirname(input_pdf), 
-                            f"{input_name}_extracted.pdf")
+    input_path = Path(doc.name)
+    output_pdf = str(input_path.with_name(f"{input_path.stem}_extracted.pdf"))
     new_doc.save(output_pdf)
     new_doc.close()
-    doc.close()
     
     return output_pdf
 
@@ -238,15 +322,14 @@ def main():
             print("No file selected. Exiting.")
             return
         
-        input_dir = os.path.dirname(input_pdf)
-        input_name = os.path.splitext(os.path.basename(input_pdf))[0]
-        output_pdf = os.path.join(input_dir, f"{input_name}_clean.pdf")
+        input_path = Path(input_pdf)
+        output_pdf = str(input_path.with_name(f"{input_path.stem}_clean.pdf"))
 
         try:
             repeat_threshold = int(input("Minimum repeat count (default 5): ") or 5)
             min_size_kb = int(input("Minimum image size in KB (default 2): ") or 2)
             zip_name = input("ZIP name (default 'removed_images'): ") or "removed_images"
-            export_zip = os.path.join(input_dir, f"{zip_name}.zip")
+            export_zip = str(input_path.parent / f"{zip_name}.zip")
 
             total, removed, unique = remove_duplicates(
                 input_pdf, output_pdf, export_zip, 
@@ -273,13 +356,11 @@ def main():
             print("No file selected. Exiting.")
             return
         
-        input_dir = os.path.dirname(input_pdf)
-        input_name = os.path.splitext(os.path.basename(input_pdf))[0]
-        output_pdf = os.path.join(input_dir, f"{input_name}_modified.pdf")
+        input_path = Path(input_pdf)
+        output_pdf = str(input_path.with_name(f"{input_path.stem}_modified.pdf"))
 
-        doc = fitz.open(input_pdf)
+        doc = fitz.open(input_pdf, filetype="pdf")
         total_pages = len(doc)
-        doc.close()
 
         print(f"\nPDF has {total_pages} pages (1-{total_pages})")
         page_input = input("Pages to remove (e.g., '1,3-5,7'): ").strip()
@@ -290,12 +371,13 @@ def main():
                 print("No valid pages selected!")
             else:
                 print(f"Removing pages: {', '.join(map(str, pages_to_remove))}")
-                if remove_pages(input_pdf, output_pdf, pages_to_remove):
+                if remove_pages(doc, output_pdf, pages_to_remove):
                     print(f"Modified PDF saved to:\n{output_pdf}")
                     success = True
                     output_files.append(output_pdf)
         except Exception as e:
             print(f"Error: {e}")
+        doc.close()
 
     elif choice == '3':
         # Merge PDFs
@@ -323,22 +405,14 @@ def main():
             print("No file selected. Exiting.")
             return
         
-        doc = fitz.open(input_pdf)
+        doc = fitz.open(input_pdf, filetype="pdf")
         total_pages = len(doc)
-        doc.close()
 
         print(f"\nPDF has {total_pages} pages (1-{total_pages})")
         page_input = input("Enter page ranges to extract (e.g., '4', '7-13', '1-10,12-18'): ").strip()
         
         try:
-            page_ranges = []
-            for part in re.split(r',', page_input.strip()):
-                if '-' in part:
-                    start, end = map(int, part.split('-'))
-                    page_ranges.append((start, end))
-                elif part:
-                    page = int(part)
-                    page_ranges.append((page, page))
+            page_ranges = list(iter_page_spec(page_input))
             
             # Validate ranges
             valid_ranges = []
@@ -349,7 +423,7 @@ def main():
                     print(f"Warning: Range {start}-{end} is invalid for PDF with {total_pages} pages")
             
             if valid_ranges:
-                created_files = split_pdf(input_pdf, valid_ranges)
+                created_files = split_pdf(doc, valid_ranges)
                 if created_files:
                     print("\nCreated files:")
                     for file in created_files:
@@ -360,6 +434,7 @@ def main():
                 print("No valid page ranges provided!")
         except Exception as e:
             print(f"Error: {e}")
+        doc.close()
 
     elif choice == '5':
         # Special Split
@@ -368,18 +443,21 @@ def main():
             print("No file selected. Exiting.")
             return
         
-        doc = fitz.open(input_pdf)
+        doc = fitz.open(input_pdf, filetype="pdf")
         total_pages = len(doc)
-        doc.close()
 
         print(f"\nPDF has {total_pages} pages (1-{total_pages})")
         page_spec = input("Enter pages to extract (e.g., '1+4+11-16'): ").strip()
         
-        output_pdf = special_split_pdf(input_pdf, page_spec)
-        if output_pdf:
-            print(f"\nCreated new PDF with selected pages: {output_pdf}")
-            success = True
-            output_files.append(output_pdf)
+        try:
+            output_pdf = special_split_pdf(doc, page_spec)
+            if output_pdf:
+                print(f"\nCreated new PDF with selected pages: {output_pdf}")
+                success = True
+                output_files.append(output_pdf)
+        except Exception as e:
+            print(f"Error: {e}")
+        doc.close()
 
     duration = (datetime.now() - start_time).total_seconds()
     print(f"\nProcessing time: {duration:.2f} seconds")
@@ -387,7 +465,7 @@ def main():
     if success:
         message = f"Operation completed in {duration:.2f} seconds\n"
         message += "Created files:\n" + "\n".join(output_files)
-        showinfo("Done!", message)
+        showinfo("Done!", message, parent=get_tk_root())
 
 if __name__ == "__main__":
     main()